@@ -1,28 +1,92 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+import atexit
 import functools
-import inspect
 import json
 import logging
 import os
+import re
 import sys
 import textwrap
-import traceback
-import subprocess as sub
 
+from collections import namedtuple
 from importlib import import_module
 from logging.handlers import WatchedFileHandler
 
 import vim
 
+try:
+    _strtype = basestring
+    _inttypes = (int, long)
+except NameError:
+    _strtype = str
+    _inttypes = (int,)
+
+try:
+    from importlib.machinery import all_suffixes
+except ImportError:
+    from imp import get_suffixes
+
+    def all_suffixes():
+        return [suffix for suffix, _, _ in get_suffixes()]
+
+try:
+    # C implementation makes reading settings of every plugin on startup
+    # noticeably faster, stdlib json is still used for writing
+    from ujson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 
 _storage = {}
 
+# Arguments of code objects, shared by all functions with the same code
+_argspec_cache = {}
+
+# Vim declarations collected during carbonate pass, None outside of it
+_pending_declarations = None
+
+# plugin_name: plugin_path of plugins waiting for the first call
+_lazy_plugins = {}
+
+# Gin instances by name
+_plugins = {}
+
+# Imported plugin module, or None if import failed, by plugin name
+_carbonate_cache = {}
+
 RUNTIME_PATH = vim.eval("&runtimepath").split(',')
 
 SETTINGS_PLACE = '.vim/py_plugins_configs'
 
+# Plugin directory has to be importable as python module
+PLUGIN_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+
+# Source, compiled and extension module files accepted by import
+MODULE_SUFFIXES = tuple(all_suffixes())
+
+# Declarations which end at a newline, so can be sent to vim joined
+BATCHABLE_DECLARATIONS = ('function!', 'let ', 'call ')
+
+# Results pyeval converts to vim values, items of containers are not checked
+VIM_RESULT_TYPES = (_strtype, bytes, float, list, tuple, dict) + _inttypes
+
+# Result is passed back by pyeval as is, without quoting it into
+# a vim return statement
+VIM_FUNCTION_TEMPLATE = textwrap.dedent("""\
+    function! {vim_function}({argnames}) {range}
+    return pyeval('pythogen._storage["{method_name}"]()')
+    endfunction
+""")
+
+# Defers import of lazy plugin until a function with its prefix is called.
+# Autocmd takes the rest of the text, so it has to stay on a single line.
+LAZY_PLUGIN_TEMPLATE = (
+    "autocmd pythogen_lazy FuncUndefined {prefix}_* "
+    "python pythogen.load_lazy_plugin('{plugin_name}')"
+)
+
 
 class cached_property(object):
     """
@@ -37,60 +101,295 @@ class cached_property(object):
         return res
 
 
+ArgSpec = namedtuple('ArgSpec', 'args varargs keywords defaults')
+
+CO_VARARGS = 0x04
+CO_VARKEYWORDS = 0x08
+
+
+def getargspec(fn):
+    """
+    Same as inspect.getargspec, but reads code object directly
+    and caches the result
+    """
+
+    code = fn.__code__
+
+    if code not in _argspec_cache:
+        names = code.co_varnames
+        nargs = code.co_argcount
+
+        # Names of *args and **kwargs follow keyword-only arguments
+        pos = nargs + getattr(code, 'co_kwonlyargcount', 0)
+
+        varargs = keywords = None
+
+        if code.co_flags & CO_VARARGS:
+            varargs = names[pos]
+            pos += 1
+
+        if code.co_flags & CO_VARKEYWORDS:
+            keywords = names[pos]
+
+        _argspec_cache[code] = (list(names[:nargs]), varargs, keywords)
+
+    args, varargs, keywords = _argspec_cache[code]
+
+    return ArgSpec(args, varargs, keywords, fn.__defaults__)
+
+
+def declare(declaration, log, **params):
+    """
+    Execute vim declaration, or postpone it until the end
+    of carbonate pass to send all declarations to vim at once.
+    With params declaration is a template, filled just before execution.
+    Errors of postponed declaration are written to log of its plugin.
+    """
+
+    if _pending_declarations is None:
+        vim.command(declaration.format(**params) if params else declaration)
+
+    else:
+        _pending_declarations.append((declaration, params, log))
+
+
+def flush_declarations():
+    global _pending_declarations
+
+    declarations, _pending_declarations = _pending_declarations, None
+
+    batch = []
+
+    for declaration, params, log in declarations or []:
+        if params:
+            declaration = declaration.format(**params)
+
+        if declaration.startswith(BATCHABLE_DECLARATIONS):
+            batch.append((declaration, log))
+            continue
+
+        # Commands like :command, :map and :autocmd take the rest of
+        # the text, newlines included, so they go to vim one by one
+        if batch:
+            run_declarations(batch)
+            batch = []
+
+        run_declaration(declaration, log)
+
+    if batch:
+        run_declarations(batch)
+
+
+def run_declarations(batch):
+    """ Execute (declaration, log) pairs by one vim command if possible """
+
+    if len(batch) > 1:
+        try:
+            vim.command('\n'.join([declaration for declaration, _ in batch]))
+            return
+
+        except vim.error:
+            # Declarations can be repeated, so the whole batch is executed
+            # again one by one to find out which of them failed
+            pass
+
+    for declaration, log in batch:
+        run_declaration(declaration, log)
+
+
+def run_declaration(declaration, log):
+    # Broken declaration of one plugin must not stop the others
+    try:
+        vim.command(declaration)
+
+    except vim.error:
+        log.exception('Declaration %r', declaration)
+
+
 def carbonate():
     """ Load all python modules from bundle directory """
+    global _pending_declarations
 
     gin = pythogen_gin
 
     gin.settings.option('enabled', default=True)
     gin.settings.option('debug', default=False)
+    gin.settings.option('lazy', default=[])
+    gin.settings.flush()
 
     if not gin.settings['enabled']:
         return
 
-    for path in RUNTIME_PATH:
-        unused, plugin_name = os.path.split(path)
+    _pending_declarations = []
+
+    try:
+        load_plugins(gin)
+
+    finally:
+        flush_declarations()
+
+    # Plugins register their options while being imported
+    for plugin in _plugins.values():
+        plugin.settings.flush()
+
+    gin.log.info('Plugins: %r', _plugins.keys())
+
+    if any([plugin.debug for plugin in _plugins.values()]):
+        if 'EXIT' in get_vim_buffers_names():
+            vim.command('qall!')
+
+    if 'PYTHOGEN-FORCE-EXIT' in get_vim_buffers_names():
+        sys.exit()
+
+
+def load_plugins(gin):
+    path_set = set(sys.path)
+    lazy = set(gin.settings['lazy'])
 
+    for plugin_name, plugin_path in _PLUGIN_INDEX:
+        # Already imported, or failed to, by previous pass or lazy loader,
+        # or still waiting for the first call with autocmd declared
+        if plugin_name in _carbonate_cache or plugin_name in _lazy_plugins:
+            continue
+
+        if plugin_name in lazy:
+            if not _lazy_plugins:
+                declare('augroup pythogen_lazy', gin.log)
+                declare('augroup END', gin.log)
+
+            # Vim functions of Gin(__name__) are named <Plugin_name>_<fn>,
+            # calling any of them imports the plugin. Its commands and maps
+            # are defined by the import, so they can't trigger it.
+            _lazy_plugins[plugin_name] = plugin_path
+            declare(LAZY_PLUGIN_TEMPLATE, gin.log, plugin_name=plugin_name,
+                    prefix=plugin_name.capitalize())
+
+            gin.log.info('Lazy: %r', plugin_name)
+            continue
+
+        load_plugin(gin, plugin_name, plugin_path, path_set)
+
+
+def index_plugins(runtime_path):
+    """
+    List (plugin_name, plugin_path) of runtime paths
+    that have python module of plugin, in runtime path order
+    """
+
+    index = []
+
+    for path in runtime_path:
+        plugin_name = os.path.basename(path)
         plugin_path = os.path.join(path, 'plugin')
 
-        if plugin_path not in sys.path:
-            sys.path.append(plugin_path)
-            path_was_appended = True
+        if PLUGIN_NAME_RE.match(plugin_name) and \
+                has_python_module(plugin_path, plugin_name):
+            index.append((plugin_name, plugin_path))
 
-        else:
-            path_was_appended = False
+    return index
 
-        try:
-            try:
-                plugin_module = import_module(plugin_name)
 
-            except vim.error:
-                gin.log.exception('Plugin %r', plugin_name)
-                raise
+def has_python_module(plugin_path, plugin_name):
+    """
+    Check by listing plugin directory, without going through import
+    machinery, for a module or package of any importable suffix
+    """
 
-            except Exception:
-                gin.log.debug('Import module: %r', plugin_name, exc_info=True)
-                raise
+    try:
+        entries = set(os.listdir(plugin_path))
+
+    except OSError:
+        return False
+
+    if any(plugin_name + suffix in entries for suffix in MODULE_SUFFIXES):
+        return True
+
+    if plugin_name not in entries:
+        return False
+
+    package_path = os.path.join(plugin_path, plugin_name)
+
+    return any(
+        os.path.isfile(os.path.join(package_path, '__init__' + suffix))
+        for suffix in MODULE_SUFFIXES
+    )
 
-        except (vim.error, Exception):
-            if path_was_appended:
+
+def load_lazy_plugin(plugin_name):
+    """ Import plugin from 'lazy' setting on first call of its function """
+    global _pending_declarations
+
+    plugin_path = _lazy_plugins.pop(plugin_name, None)
+
+    if plugin_path is None:
+        return
+
+    vim.command('autocmd! pythogen_lazy FuncUndefined %s_*' %
+                plugin_name.capitalize())
+
+    # Lazy plugin can be called while another batch is being collected,
+    # e.g. from a plugin imported by carbonate
+    outer_declarations = _pending_declarations
+    _pending_declarations = []
+
+    try:
+        plugin_module = load_plugin(pythogen_gin, plugin_name, plugin_path,
+                                    set(sys.path))
+
+        # Function prefix of another Gin name does not match the autocmd
+        if plugin_module is not None and plugin_name not in _plugins:
+            pythogen_gin.log.warning(
+                'Lazy plugin %r has no Gin of the same name', plugin_name)
+
+    finally:
+        flush_declarations()
+        _pending_declarations = outer_declarations
+
+
+def load_plugin(gin, plugin_name, plugin_path, path_set):
+    if plugin_path not in path_set:
+        path_index = len(sys.path)
+        sys.path.append(plugin_path)
+        path_set.add(plugin_path)
+
+    else:
+        path_index = None
+
+    try:
+        plugin_module = import_module(plugin_name)
+
+    except Exception:
+        # Plugin module is known to exist, so any error, ImportError
+        # included, means that the plugin itself is broken
+        gin.log.exception('Plugin %r', plugin_name)
+        plugin_module = None
+
+    _carbonate_cache[plugin_name] = plugin_module
+
+    if plugin_module is None:
+        if path_index is not None:
+            # Plugin could change sys.path while being imported
+            if sys.path[path_index:path_index + 1] == [plugin_path]:
+                del sys.path[path_index]
+
+            else:
                 sys.path.remove(plugin_path)
 
-            continue
+            path_set.discard(plugin_path)
 
-        vim.command('let g:loaded_python_plugin_%s = 1' %
-                    plugin_name.replace('-', '_'))
+        return
 
-        gin.log.info('Loaded: %r', plugin_module)
+    # PLUGIN_NAME_RE allows only names that are valid in vim variables
+    declare('let g:loaded_python_plugin_%s = 1' % plugin_name, gin.log)
 
-    gin.log.info('Plugins: %r', Gin.plugins.keys())
+    gin.log.info('Loaded: %r', plugin_module)
 
-    if any([plugin.debug for plugin in Gin.plugins.values()]):
-        if 'EXIT' in get_vim_buffers_names():
-            vim.command('qall!')
+    return plugin_module
 
-    if 'PYTHOGEN-FORCE-EXIT' in get_vim_buffers_names():
-        sys.exit()
+
+def fn_method_name(fn):
+    return fn if isinstance(fn, _strtype) else \
+        '%s_%s' % (fn.__name__, id(fn))
 
 
 def get_vim_buffers_names():
@@ -102,12 +401,12 @@ def get_vim_buffers_names():
 
 class TextObject(object):
     """ Base class for custom vim textobject """
-    pass
+    __slots__ = ()
 
 
 class Movement(object):
     """ Base class for custom vim movement """
-    pass
+    __slots__ = ()
 
 
 """
@@ -117,17 +416,33 @@ TODO:
 
 
 class Settings(object):
-    def __init__(self, name):
+    __slots__ = ('name', '_storage', '_options', '_dirty', '_changed',
+                 '_stamp', '_file_name', '_pretty')
+
+    # Settings files are edited by hand, set to False for compact output.
+    # Applies to all instances, pass pretty to constructor for a single one.
+    pretty = True
+
+    def __init__(self, name, pretty=None):
         self.name = name
+        self._pretty = pretty
         self._storage = {}
         self._options = {}
+        self._dirty = False
+        self._changed = set()
+        self._stamp = None
+
+        self._file_name = os.path.join(os.environ['HOME'], SETTINGS_PLACE,
+                                       self.name) + '.json'
 
         self.force_load()
 
+        # Changed values are written once, at least when vim exits
+        atexit.register(self.flush)
+
     @property
     def file_name(self):
-        return os.path.join(os.environ['HOME'], SETTINGS_PLACE,
-                            self.name) + '.json'
+        return self._file_name
 
     def force_load(self):
         try:
@@ -137,7 +452,7 @@ class Settings(object):
             if os.path.exists(self.file_name):
                 # If file exists and load failed, create backup before saving
                 # clean settings.
-                sub.check_call(['mv', self.file_name, self.file_name + '~'])
+                os.rename(self.file_name, self.file_name + '~')
 
             # Save clean
             self.save()
@@ -145,14 +460,50 @@ class Settings(object):
 
     def load(self):
         with open(self.file_name, 'rb') as f:
-            self._storage = json.load(f)
+            self._stamp = self.file_stamp(os.fstat(f.fileno()))
+            self._storage = json_loads(f.read())
+
+        for name, kwargs in self._options.items():
+            self._storage.setdefault(name, kwargs['default'])
+
+    @staticmethod
+    def file_stamp(stat):
+        # Size and inode catch a write or a replace within mtime resolution
+        return stat.st_mtime, stat.st_size, stat.st_ino
+
+    def is_changed_on_disk(self):
+        """ True if file was saved by someone else since last load or save """
+
+        try:
+            return self.file_stamp(os.stat(self.file_name)) != self._stamp
+
+        except OSError:
+            return False
+
+    def reload(self):
+        """ Load settings again if file was changed by someone else """
+
+        if self.is_changed_on_disk():
+            self.force_load()
 
     def save(self):
-        sub.check_call(['mkdir', '-p', os.path.dirname(self.file_name)])
+        dir_name = os.path.dirname(self.file_name)
+
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+
+        pretty = self.pretty if self._pretty is None else self._pretty
+
+        if pretty:
+            dump_kwargs = {'sort_keys': True, 'indent': 4}
+
+        else:
+            dump_kwargs = {'separators': (',', ':')}
 
         with open(self.file_name, 'wb') as f:
-            json.dump(dict(self.items()), f,
-                      ensure_ascii=False, sort_keys=True, indent=4)
+            json.dump(self._storage, f, ensure_ascii=False, **dump_kwargs)
+
+        self._stamp = self.file_stamp(os.stat(self.file_name))
 
     def option(self, name, *args, **kwargs):
         if 'default' not in kwargs:
@@ -161,11 +512,29 @@ class Settings(object):
         self._options[name] = kwargs
 
         if name not in self._storage:
-            self.save()
-            self.load()
+            # New option is stored in memory only, see flush
+            self._storage[name] = kwargs['default']
+            self._dirty = True
+
+    def flush(self):
+        """ Save settings if anything was changed since last save """
+
+        if not self._dirty:
+            return
+
+        if self.is_changed_on_disk():
+            # Keep values saved by someone else, apply only own changes
+            changes = {k: self._storage[k] for k in self._changed}
+            self.force_load()
+            self._storage.update(changes)
+
+        self.save()
+        self._dirty = False
+        self._changed.clear()
 
     def items(self):
-        return {k: self[k] for k in self._options.keys()}
+        # option() and load() keep every registered option in storage
+        return {k: self._storage[k] for k in self._options}
 
     def __getitem__(self, name):
         # Return stored value or default value for this option
@@ -173,30 +542,41 @@ class Settings(object):
             self._options[name]['default']
 
     def __setitem__(self, name, value):
-        self.force_load()
+        # Unsaved changes in memory take precedence over the file
+        if not self._dirty:
+            self.reload()
+
         self._storage[name] = value
-        self.save()
+        self._changed.add(name)
+        self._dirty = True
 
 
-class Plugins(dict):
-    def register(self, name, plugin):
-        if name in self:
-            raise Exception('Already existed plugin: %r', name)
+def _register_plugin(name, plugin):
+    if name in _plugins:
+        raise Exception('Already existed plugin: %r' % name)
 
-        self[name] = plugin
+    _plugins[name] = plugin
 
 
 class Gin(object):
     """ Main entry-point for individual plugin """
 
-    plugins = Plugins()
+    plugins = _plugins
 
     def __init__(self, name):
         self.name = name
 
-        self.plugins.register(self.name, self)
+        # Prefix of names of vim functions of this plugin
+        self._safe_name = self.name.capitalize().replace('-', '_')
+
+        _register_plugin(self.name, self)
+
+        # Every plugin needs its settings right away, at least for LOG_PATH.
+        # Created after registration, so a duplicate name touches no file.
+        self.settings = Settings(self.name)
 
         self._methods = {}
+        self._vim_fn_names = set()
 
         self.debug = bool('DEBUG-%s' % self.name in get_vim_buffers_names())
 
@@ -224,29 +604,24 @@ class Gin(object):
         handler.setFormatter(fm)
         self.log.addHandler(handler)
 
-        self.log.debug('Plugin name: %r', self.name)
+        self.settings.flush()
 
-    @property
-    def settings(self):
-        if not getattr(self, '_settings', False):
-            self._settings = Settings(self.name)
-
-        return self._settings
+        self.log.debug('Plugin name: %r', self.name)
 
-    @classmethod
-    def get(cls, name):
-        return cls.plugins.get(name)
+    get = staticmethod(_plugins.get)
 
     def get_method(self, fn):
-        return self._methods.get(GinMethod.fn_method_name(fn))
+        return self._methods.get(fn_method_name(fn))
 
     def method(self, fn):
-        name = GinMethod.fn_method_name(fn)
+        name = fn_method_name(fn)
 
-        if name not in self._methods:
-            self._methods[name] = GinMethod(self, fn)
+        method = self._methods.get(name)
 
-        return self._methods[name]
+        if method is None:
+            method = self._methods[name] = GinMethod(self, fn)
+
+        return method
 
     def vim_operator(self, fn):
         """
@@ -303,42 +678,69 @@ class GinMethod(object):
     def __init__(self, gin, fn):
         self.gin = gin
         self.fn = fn
+        self.name = fn_method_name(fn)
+
+        # Everything a call from vim needs is computed once, here
+        self.spec = spec = getargspec(fn)
+
+        self.range_argname = 'vimrange' if 'vimrange' in spec.args else None
+
+        argnames = [a for a in spec.args if a != 'vimrange']
+
+        if spec.defaults:
+            argnames = argnames[:-len(spec.defaults)]
+
+        self.vim_fn_argnames = tuple(argnames)
+        self.vim_fn_has_varargs = bool(spec.defaults or spec.varargs)
+
+        self.run_from_vim_function = self.make_dispatcher(
+            fn, self.vim_fn_argnames, self.vim_fn_has_varargs,
+            self.range_argname)
 
     @property
     def log(self):
         return self.gin.log
 
-    @staticmethod
-    def fn_method_name(fn):
-        return fn if isinstance(fn, basestring) else \
-            '%s_%s' % (fn.__name__, id(fn))
+    @classmethod
+    def make_dispatcher(cls, fn, vim_fn_argnames, varargs, range_argname):
+        """
+        Specialized function for calls from vim,
+        all its state is bound as partial arguments
+        """
 
-    @cached_property
-    def name(self):
-        return self.fn_method_name(self.fn)
+        # All arguments are fetched by single vim expression,
+        # range goes last as [firstline, lastline]
+        args_expr = '[%s]' % ', '.join(['a:%s' % n for n in vim_fn_argnames])
 
-    @staticmethod
-    def eval_vim_fn_args(fn, vim_fn_argnames, varargs, range_argname):
-        def vim_eval_a(name):
-            return vim.eval('a:%s' % name)
+        if varargs:
+            args_expr += ' + a:000'
 
-        args = [vim_eval_a(name) for name in vim_fn_argnames]
+        if range_argname:
+            args_expr += ' + [[a:firstline, a:lastline]]'
 
-        if varargs:
-            argn = int(vim.eval('a:0'))
+        return functools.partial(cls.eval_vim_fn_args,
+                                 fn, args_expr, range_argname)
 
-            for j in xrange(1, argn + 1):
-                args.append(vim.eval('a:%s' % j))
+    @staticmethod
+    def eval_vim_fn_args(fn, args_expr, range_argname):
+        args = vim.eval(args_expr)
 
         kwargs = {}
 
         if range_argname:
-            kwargs[range_argname] = (
-                vim.eval('a:firstline'),
-                vim.eval('a:lastline')
-            )
+            kwargs[range_argname] = tuple(args.pop())
 
-        vim.command('return "{}"'.format(fn(*args, **kwargs)))
+        result = fn(*args, **kwargs)
+
+        # Vim function without explicit return yields zero
+        if result is None:
+            return 0
+
+        # pyeval fails on other types, e.g. set, so vim gets their text
+        if not isinstance(result, VIM_RESULT_TYPES):
+            return str(result)
+
+        return result
 
     def make_vim_command(self, command_name):
         '''
@@ -353,14 +755,14 @@ class GinMethod(object):
         -nargs=+    Arguments must be supplied, but any number are allowed
         '''
 
-        spec = inspect.getargspec(self.fn)
+        spec = self.spec
 
         len_defaults = len(spec.defaults or [])
-        self.log.debug('len_defaults: %s' % len_defaults)
+        self.log.debug('len_defaults: %s', len_defaults)
 
         len_args = len(spec.args) - len_defaults
 
-        self.log.debug('len_args: %s' % len_args)
+        self.log.debug('len_args: %s', len_args)
 
         if not len_args and not len_defaults and not spec.varargs:
             nargs = '0'
@@ -385,7 +787,7 @@ class GinMethod(object):
 
         self.gin.log.debug('Make vim command: %s', declaration)
 
-        vim.command(declaration)
+        declare(declaration, self.log)
 
     @cached_property
     def vim_function_name(self):
@@ -396,58 +798,33 @@ class GinMethod(object):
         if getattr(self, '_vim_fn_name', False):
             return
 
-        self._vim_fn_name = '_'.join([
-            self.gin.name.capitalize(),
-            self.fn.__name__,
-            str(id(self.fn)),
-        ]).replace('-', '_')
+        # Stable name, so vim can call it before lazy plugin is imported
+        vim_fn_name = '%s_%s' % (self.gin._safe_name, self.fn.__name__)
 
-        spec = inspect.getargspec(self.fn)
+        if vim_fn_name in self.gin._vim_fn_names:
+            # Another function of this plugin has the same name
+            vim_fn_name = '%s_%s' % (vim_fn_name, id(self.fn))
 
-        argnames = [a for a in spec.args if a not in ['vimrange']]
+        self.gin._vim_fn_names.add(vim_fn_name)
+        self._vim_fn_name = vim_fn_name
 
-        if spec.defaults:
-            argnames = argnames[:-len(spec.defaults)]
-
-        self.vim_fn_argnames = argnames[:]
-        self.vim_fn_has_varargs = bool(spec.defaults or spec.varargs)
+        argnames = list(self.vim_fn_argnames)
 
         if self.vim_fn_has_varargs:
             argnames.append('...')
 
-        def wrapper():
-            return self.eval_vim_fn_args(
-                self.fn,
-                self.vim_fn_argnames,
-                varargs=self.vim_fn_has_varargs,
-                range_argname='vimrange' if 'vimrange' in spec.args else None
-            )
-
-        self.run_from_vim_function = wrapper
-
-        template = """
-            function! %(vim_function)s(%(argnames)s) %(range)s
-            python << endpython
-            from pythogen import Gin
-            plugin = Gin.get('%(plugin_name)s')
-            method = plugin.get_method('%(method_name)s')
-            method.run_from_vim_function()
-            endpython
-            endfunction
-        """
+        _storage[self.name] = self.run_from_vim_function
 
-        declaration = textwrap.dedent(template) % {
+        params = {
             'vim_function': self._vim_fn_name,
             'argnames': ', '.join(argnames),
-            'range': 'range' if 'vimrange' in spec.args else '',
-            'plugin_name': self.gin.name,
+            'range': 'range' if self.range_argname else '',
             'method_name': self.name,
         }
 
-        self.gin.log.debug('Make vim fn: %s',
-                           declaration.strip().splitlines()[0])
+        self.log.debug('Make vim fn: %(vim_function)s(%(argnames)s)', params)
 
-        vim.command(declaration)
+        declare(VIM_FUNCTION_TEMPLATE, self.log, **params)
 
     @cached_property
     def vim_operator(self):
@@ -475,16 +852,19 @@ class VimOperator(object):
 
         self.log.debug('VimOperator: %r %r', self.plug, cmd)
 
-        vim.command(cmd)
+        declare(cmd, self.log)
 
     def map(self, seq):
         cmd = 'map %s %s' % (seq, self.plug)
         self.log.debug('Map operator: %r', cmd)
-        vim.command(cmd)
+        declare(cmd, self.log)
 
     @property
     def log(self):
         return self.gin_method.log
 
 
+# Built once on import, carbonate only imports modules known to exist
+_PLUGIN_INDEX = index_plugins(RUNTIME_PATH)
+
 pythogen_gin = Gin(__name__)
@@ -2,8 +2,8 @@
 " @Author       : Sergey Ivanov (ivanov.waltz@gmail.com)
 " vi: ft=vim:tw=80:sw=4:ts=4:fdm=marker
 
-if ! has('python') || v:version < 703
-    echoerr "Unable to start pythogen. Pythogen depends on Vim >= 7.3 with Python support complied in."
+if ! has('python') || v:version < 703 || ! exists('*pyeval')
+    echoerr "Unable to start pythogen. Pythogen depends on Vim >= 7.3 with Python support and pyeval() complied in."
     finish
 endif
 